@@ -1,124 +1,231 @@
 import json
 import os
+import re
+from itertools import chain
 
-def strict_filter_json(input_file, output_file):
-    print(f"正在讀取 {input_file}...")
-    try:
-        with open(input_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        print("錯誤：找不到輸入檔案。")
-        return
+try:
+    # 有裝 ijson 就逐筆串流解析，不必把整個 JSON 讀進記憶體
+    import ijson
+except ImportError:
+    ijson = None
 
-    original_count = len(data)
-    
-    # ============================
-    # 🔧 設定區 (您可以調整這裡)
-    # ============================
-    
-    # 1. 演技門檻：至少要有幾種 Emotion 才保留？
-    # (例如：默認, 開心, 生氣, 難過 這樣算 4 種)
-    MIN_EMOTION_COUNT = 6
-
-    # 2. 路人黑名單標籤：只要包含這些標籤的角色就刪除
-    # 包含繁簡體常見寫法
-    BANNED_TAGS = [
-        "普通", "平民", "龙套", "龍套", "路人", "村民", 
-        "士兵", "卫兵", "守卫", "男", "女", # 太過籠統的標籤
-        "怪物", "生物", "纯水精灵", "元素生命", "丘丘人"
-    ]
-
-    # 3. 名字黑名單 (部分名字本身就是雜魚)
-    BANNED_NAMES = [
-        "NPC", "系统", "旁白", "未知", "大叔", "小孩", "少女"
-    ]
+try:
+    # 有裝 orjson 就用它解析與輸出，比內建 json 快
+    import orjson
+except ImportError:
+    orjson = None
 
-    # ============================
-    # 階段一：預處理 (合併 _ZH 與 非_ZH)
-    # ============================
-    merged_data = {}
-    # 先把所有 key 轉成不帶 _ZH 的基礎名，用來判斷重複
-    # 邏輯：優先存入帶 _ZH 的資料，如果遇到不帶 _ZH 的，只有在沒資料時才存入
+try:
+    # 有裝 pyahocorasick 就用 Aho-Corasick 一次比對所有黑名單標籤
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# ============================
+# 🔧 設定區 (您可以調整這裡)
+# ============================
+
+# 1. 演技門檻：至少要有幾種 Emotion 才保留？
+# (例如：默認, 開心, 生氣, 難過 這樣算 4 種)
+MIN_EMOTION_COUNT = 6
+
+# 2. 路人黑名單標籤：只要包含這些標籤的角色就刪除
+# 包含繁簡體常見寫法
+BANNED_TAGS = [
+    "普通", "平民", "龙套", "龍套", "路人", "村民", 
+    "士兵", "卫兵", "守卫", "男", "女", # 太過籠統的標籤
+    "怪物", "生物", "纯水精灵", "元素生命", "丘丘人"
+]
+
+# 3. 名字黑名單 (部分名字本身就是雜魚)
+BANNED_NAMES = frozenset({
+    "NPC", "系统", "旁白", "未知", "大叔", "小孩", "少女"
+})
+# ============================
+
+
+def build_tag_automaton():
+    """用 BANNED_TAGS 建立 Aho-Corasick 自動機；不可用時回傳 None。"""
+    if ahocorasick is None or not BANNED_TAGS:
+        return None
+    automaton = ahocorasick.Automaton()
+    for banned in set(BANNED_TAGS):
+        automaton.add_word(banned, banned)
+    automaton.make_automaton()
+    return automaton
+
+
+TAG_AUTOMATON = build_tag_automaton()
+
+# 語言過濾：key 含這些字樣就視為非中文語音
+LANG_RE = re.compile(r'_en|_ja|english|japanese|英语|日语', re.I)
+
+# check_entry 的判定結果
+PASSED, FEW_EMOTIONS, BANNED = range(3)
+
+
+def iter_entries(f):
+    """逐筆產生頂層的 (key, value)。"""
+    if ijson is not None:
+        yield from ijson.kvitems(f, '', use_float=True)
+    elif orjson is not None:
+        yield from orjson.loads(f.read()).items()
+    else:
+        yield from json.load(f).items()
+
+
+def dumps_json(obj):
+    """把 obj 轉成 UTF-8 的 JSON bytes (縮排 2)；合併過的 tags 是 set，交給 default 轉回 list。"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=list, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, ensure_ascii=False, indent=2, default=list).encode('utf-8')
+
+
+def write_entries(f, items):
+    """依序把 (key, value) 寫成一個 JSON 物件，格式與 json.dump(indent=2) 相同。
+
+    逐筆寫出，不必為了調整順序再組一份完整的 dict。
+    """
+    separator = b"\n  "
+    f.write(b"{")
+    for key, value in items:
+        # 值本身的縮排要再往內推一層 (JSON 字串中的換行都已跳脫，可以直接替換)
+        f.write(separator + dumps_json(key) + b": " + dumps_json(value).replace(b"\n", b"\n  "))
+        separator = b",\n  "
+    f.write(b"}" if separator == b"\n  " else b"\n}")
+
+
+def has_enough_emotions(value):
+    """Emotion 種類是否達到 MIN_EMOTION_COUNT。"""
+    # 一般情況 emotion 就是 list，直接比長度
+    emotions = value.get("emotion")
     
-    # 為了確保 _ZH 優先，我們先處理所有帶 _ZH 的 keys
-    sorted_keys = sorted(data.keys(), key=lambda k: 1 if k.endswith('_ZH') else 2)
+    # 簡單的防呆，以防萬一有些舊數據沒改到 (舊的 dict 結構)，只取第一個值
+    if isinstance(emotions, dict):
+        emotions = next(iter(emotions.values()), None)
     
-    temp_map = {} # map[base_name] = full_key
-
-    for key in sorted_keys:
-        value = data[key]
-        
-        # 語言過濾 (雖然你的新JSON可能已經沒這些了，但保留著以防萬一)
-        key_lower = str(key).lower()
-        if any(x in key_lower for x in ["_en", "_ja", "english", "japanese", "英语", "日语"]):
-            continue
-
-        base_name = key.replace("_ZH", "")
-        
-        if base_name in temp_map:
-            # 已存在 (因為我們讓 _ZH 優先跑，所以這裡通常是遇到了無 _ZH 的版本)
-            # 我們把無 _ZH 版本的 tags 合併進去，但保留 _ZH 的主體數據
-            existing_key = temp_map[base_name]
-            existing_data = merged_data[existing_key]
-            
-            # 合併 Tags
-            new_tags = set(existing_data.get('tags', [])) | set(value.get('tags', []))
-            merged_data[existing_key]['tags'] = list(new_tags)
-        else:
-            # 新條目
-            temp_map[base_name] = key
-            merged_data[key] = value
-
-    print(f"預處理(去重/語言過濾)後數量: {len(merged_data)}")
+    return len(emotions or ()) >= MIN_EMOTION_COUNT
+
+
+def has_banned_tag(tags):
+    """tags 中是否有標籤包含黑名單字詞 (例如 "普通人" 包含 "普通")。"""
+    if TAG_AUTOMATON is not None:
+        # 用 \x01 串起所有標籤，只掃描一次；分隔字元避免跨標籤誤判
+        blob = "\x01".join(tags)
+        return next(TAG_AUTOMATON.iter(blob), None) is not None
+
+    # 沒裝 pyahocorasick 時逐一比對
+    return any(banned in tag for tag in tags for banned in BANNED_TAGS)
+
+
+def is_banned_name(base_name):
+    """角色名是否在名字黑名單中。"""
+    # key 格式通常是 "原神-中文-名字_ZH" 或 "原神-中文-名字"
+    # 取最後一段並去掉 _ZH
+    name_part = base_name.split('-')[-1].replace("_ZH", "")
+    return name_part in BANNED_NAMES
+
+
+def merge_tags(target, tags):
+    """把 tags 併入 target；碰撞時轉成 set 就地更新，輸出時再轉回 list。"""
+    merged = target.get('tags', [])
+    if not isinstance(merged, set):
+        merged = target['tags'] = set(merged)
+    merged.update(tags)
 
+
+def check_entry(value, is_zh, base_name):
+    """檢查單筆資料本身的條件，回傳 PASSED / FEW_EMOTIONS / BANNED。
+
+    BANNED 代表名字或標籤中了黑名單，整組都要淘汰；
+    FEW_EMOTIONS 只有在這筆是主體數據時才會影響結果。
+    """
+    # 由便宜到昂貴依序檢查，讓大部分淘汰在掃描標籤前就結束
+    # 1. 檢查名字黑名單 (一次 split 加一次 set 查詢)
+    if is_banned_name(base_name):
+        return BANNED
+
+    # 2. 檢查 Emotion 數量
+    # _ZH 版本一定是主體數據，演技不足整組就會淘汰，不必再掃描標籤
+    enough_emotions = has_enough_emotions(value)
+    if is_zh and not enough_emotions:
+        return FEW_EMOTIONS
+
+    # 3. 檢查黑名單標籤
+    if has_banned_tag(value.get("tags", [])):
+        return BANNED
+    return PASSED if enough_emotions else FEW_EMOTIONS
+
+
+def strict_filter_json(input_file, output_file):
+    print(f"正在讀取 {input_file}...")
+    
     # ============================
-    # 階段二：高強度過濾
+    # 合併 _ZH 與 非_ZH，同時高強度過濾
     # ============================
+    # 先把所有 key 轉成不帶 _ZH 的基礎名，用來判斷重複
+    # 邏輯：帶 _ZH 的資料是主體數據；不帶 _ZH 的只有在沒資料時才當主體，其餘只合併 tags
+    # 因為是邊讀邊處理，晚到的 _ZH 版本會取代先前存入的無 _ZH 版本
     final_data = {}
-    
-    for key, value in merged_data.items():
-        # 1. 檢查 Emotion 數量 [修改點：適應新結構]
-        # 直接讀取 emotion list，如果沒有該 key 則回傳空 list
-        emotions = value.get("emotion", [])
-        
-        # 簡單的防呆，以防萬一有些舊數據沒改到
-        if not isinstance(emotions, list):
-            # 如果不是 list (例如還是舊的 dict)，嘗試抓取值
-            if isinstance(emotions, dict):
-                 emotions = list(emotions.values())[0] if emotions else []
-        
-        if len(emotions) < MIN_EMOTION_COUNT:
-            continue
-
-        # 2. 檢查黑名單標籤
-        current_tags = value.get("tags", [])
-        is_banned_tag = False
-        for tag in current_tags:
-            for banned in BANNED_TAGS:
-                if banned in tag: # 例如 "普通人" 包含 "普通"
-                    is_banned_tag = True
-                    is_banned_tag = True
-                    break
-            if is_banned_tag: break
-        
-        if is_banned_tag:
-            continue
-
-        # 3. 檢查名字黑名單
-        is_banned_name = False
-        for bad_name in BANNED_NAMES:
-            # key 格式通常是 "原神-中文-名字_ZH" 或 "原神-中文-名字"
-            # 取最後一段並去掉 _ZH
-            name_part = key.split('-')[-1].replace("_ZH", "")
-            
-            if bad_name == name_part: 
-                is_banned_name = True
-                break
-        
-        if is_banned_name:
-            continue
-
-        final_data[key] = value
+    pending = {}    # 演技不足的無 _ZH 主體：等晚到的 _ZH 版本取代時合併 tags，最後丟棄
+    temp_map = {}   # map[base_name] = 主體數據的 full_key
+    rejected = set() # 已整組淘汰的 base_name
+    original_count = 0
+
+    try:
+        with open(input_file, 'rb') as f:
+            for key, value in iter_entries(f):
+                original_count += 1
+                
+                # 語言過濾 (雖然你的新JSON可能已經沒這些了，但保留著以防萬一)
+                if LANG_RE.search(key):
+                    continue
+
+                is_zh = key.endswith("_ZH")
+                base_name = key[:-3] if is_zh else key
+                if base_name in rejected:
+                    continue
+
+                existing_key = temp_map.get(base_name)
+                is_main = existing_key is None or (is_zh and not existing_key.endswith("_ZH"))
+                verdict = check_entry(value, is_zh, base_name)
+
+                # 任一版本的名字或標籤中了黑名單，合併後也會中標；
+                # Emotion 數量只看主體數據，_ZH 主體之後不會再被取代
+                if verdict == BANNED or (is_main and is_zh and verdict == FEW_EMOTIONS):
+                    # 整組淘汰，連同先前存入的版本
+                    if existing_key is not None:
+                        final_data.pop(existing_key, None)
+                        pending.pop(existing_key, None)
+                        del temp_map[base_name]
+                    rejected.add(base_name)
+                    continue
+
+                if not is_main:
+                    # 已有主體數據：只把這個版本的 tags 合併進去
+                    holder = final_data[existing_key] if existing_key in final_data else pending[existing_key]
+                    merge_tags(holder, value.get("tags", ()))
+                    continue
+
+                if existing_key is not None:
+                    # 晚到的 _ZH 版本取代先前的無 _ZH 版本，並沿用它的 tags
+                    if existing_key in final_data:
+                        previous = final_data.pop(existing_key)
+                    else:
+                        previous = pending.pop(existing_key)
+                    merge_tags(value, previous.get('tags', ()))
+
+                temp_map[base_name] = key
+                if verdict == PASSED:
+                    final_data[key] = value
+                else:
+                    pending[key] = value
+    except FileNotFoundError:
+        print("錯誤：找不到輸入檔案。")
+        return
+
+    print(f"預處理(去重/語言過濾)後數量: {len(temp_map) + len(rejected)}")
 
     # ============================
     # 輸出
@@ -130,8 +237,13 @@ def strict_filter_json(input_file, output_file):
     print(f"最終數量: {len(final_data)}")
     print(f"共移除: {removed_count}")
 
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(final_data, f, ensure_ascii=False, indent=2)
+    # 維持 _ZH 條目在前的輸出順序 (只有兩種優先序，線性分組即可，不必排序)
+    zh_keys, plain_keys = [], []
+    for key in final_data:
+        (zh_keys if key.endswith('_ZH') else plain_keys).append(key)
+
+    with open(output_file, 'wb') as f:
+        write_entries(f, ((key, final_data[key]) for key in chain(zh_keys, plain_keys)))
     print(f"檔案已儲存: {output_file}")
 
 if __name__ == "__main__":
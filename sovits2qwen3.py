@@ -1,7 +1,8 @@
 import os
 import re
 import shutil
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from gradio_client import Client, handle_file
 
 # ================= 設定區 =================
@@ -14,6 +15,9 @@ OUTPUT_DIR = "qwen3_tts_voices"
 # Gradio API 地址
 API_URL = "http://127.0.0.1:8000/"
 
+# 同時送出的 API 請求數量 (視伺服器能負荷的並行數調整)
+MAX_WORKERS = 8
+
 # 情緒對照表 (中文 -> 英文)
 EMOTION_MAP = {
     "中立": "neutral",
@@ -27,13 +31,151 @@ EMOTION_MAP = {
 }
 # =========================================
 
+# WAV 檔名格式 (不含副檔名): 【情緒】REF文字
+WAV_NAME_RE = re.compile(r"^【([^】]*)】(.*)$")
+WAV_SUFFIXES = (".wav", ".WAV")
+
+# 掃描時不進入的資料夾 (另外所有 "." 開頭的隱藏資料夾也會略過，例如 .git、.cache、.Trashes)
+SKIPPED_DIRS = frozenset({"__MACOSX"})
+
+def is_skipped_dir(name):
+    """隱藏資料夾與系統資料夾裡不會有要處理的語音，整個略過。"""
+    return name.startswith(".") or name in SKIPPED_DIRS
+
+# 預先綁定 EMOTION_MAP.get，省去每個檔案一次的屬性查找
+EMOTION_GET = EMOTION_MAP.get
+
+def walk_wavs(root):
+    """遞迴產生 root 底下所有 WAV 檔的 os.DirEntry (已帶有 name 與 path)。"""
+    # os.scandir 的 DirEntry 會沿用讀目錄時取得的檔案類型，不必每個檔案再 stat 一次
+    try:
+        entries = os.scandir(root)
+    except OSError as e:
+        # 無法讀取的資料夾 (例如 System Volume Information) 略過，繼續掃描其他資料夾
+        print(f"[略過] 無法讀取資料夾: {root}, {e}")
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if not is_skipped_dir(entry.name):
+                    yield from walk_wavs(entry.path)
+            elif entry.name.endswith(WAV_SUFFIXES):
+                yield entry
+
+@lru_cache(maxsize=None)
+def parse_folder(folder_name):
+    """把角色資料夾名稱轉成檔名用的 "名子" (例如 星穹铁道_「蕉授」)。"""
+    # 解析資料夾結構
+    # 預期格式: 系列名-語言-角色名 (以 "-" 分隔)
+    # 只用到前三段，切到第三個 "-" 就停 (角色名後面若還有 "-"，仍只取到那裡)
+    folder_parts = folder_name.split('-', 3)
+    
+    if len(folder_parts) >= 3 and folder_parts[1] == '中文':
+        series_name = folder_parts[0] # 星穹铁道
+        role_name = folder_parts[2]   # 「蕉授」 (保留原括號，或可視需求移除)
+        
+        # 組合成 "名子" 部分 (用 _ 分隔)
+        # 結果: 星穹铁道_「蕉授」
+        return f"{series_name}_{role_name}"
+
+    # 格式不符時的備案
+    full_name = folder_name.replace('-', '_')
+    print(f"[警告] 資料夾格式特殊，將直接使用: {full_name}")
+    return full_name
+
+def parse_wav(wav, folder_name):
+    """解析 WAV 檔 (os.DirEntry) 的檔名與所屬資料夾。
+
+    回傳 (full_name, emotion_zh, emotion_en, ref_text)，檔名格式不符時回傳 None。
+    """
+    file = wav.name
+
+    # === A. 解析 WAV 檔名獲取情緒與文本 ===
+    # 格式範例: 【开心】蕉蕉蕉.wav (副檔名已在掃描時確認過，這裡直接切掉)
+    match = WAV_NAME_RE.match(file[:-4])
+    
+    if not match:
+        print(f"[略過] 檔名格式不符: {file}")
+        return None
+    
+    emotion_zh = match.group(1) # 中文情緒
+    ref_text = match.group(2)   # REF文字
+
+    # 將中文情緒轉換為英文，如果找不到對應則預設為 'unknown'
+    emotion_en = EMOTION_GET(emotion_zh, "unknown")
+
+    # === B. 解析資料夾名稱獲取角色資訊 ===
+    # (parse_folder 有快取，同一個角色資料夾的解析只做一次)
+    full_name = parse_folder(folder_name)
+
+    return full_name, emotion_zh, emotion_en, ref_text
+
+def process_wav(client, new_filename, job):
+    """用單一 WAV 檔產生 new_filename：成功回傳 True，失敗回傳 False。"""
+    wav, full_name, emotion_zh, emotion_en, ref_text = job
+
+    # === C. 呼叫 API ===
+    print(f"處理中: {full_name} | {emotion_zh} -> {emotion_en}")
+    
+    try:
+        result = client.predict(
+            ref_aud=handle_file(wav.path),
+            ref_txt=ref_text,
+            use_xvec=False,
+            api_name="/save_prompt"
+        )
+        
+        generated_file_path = result[0]
+        
+        if generated_file_path and os.path.isfile(generated_file_path):
+            # === D. 重新命名並搬移 ===
+            destination = os.path.join(OUTPUT_DIR, new_filename)
+            
+            try:
+                # 同一個檔案系統時只是一次 rename，舊檔會直接被覆蓋
+                os.replace(generated_file_path, destination)
+            except OSError:
+                # 跨磁碟等無法 rename 的情況，退回 shutil.move (複製後刪除)
+                # 如果檔案已存在，先刪除舊的 (shutil.move 在某些系統覆蓋會有問題)
+                if os.path.exists(destination):
+                    os.remove(destination)
+                shutil.move(generated_file_path, destination)
+            print(f"  -> 成功儲存: {new_filename} ({wav.path})")
+            return True
+        else:
+            print(f"  -> API 回傳成功但找不到檔案: {wav.path}")
+            return False
+
+    except Exception as e:
+        print(f"  -> API 呼叫失敗: {wav.path}, {e}")
+        return False
+
+def process_output(client, new_filename, candidates):
+    """產生單一輸出檔：從最後掃描到的 WAV 往前嘗試，第一個成功就停止。
+
+    照順序處理時留下的是最後一個成功的 WAV，從後往前試結果相同，
+    也不必替之後會被覆蓋的 WAV 呼叫 API。
+    """
+    for job in reversed(candidates):
+        if process_wav(client, new_filename, job):
+            return True
+    return False
+
 def main():
-    # 1. 確保輸出目錄存在
+    # 1. 確認來源目錄存在，並確保輸出目錄存在
+    if not os.path.isdir(SOURCE_DIR):
+        print(f"找不到來源目錄，請確認 SOURCE_DIR 設定: {SOURCE_DIR}")
+        return
+
     if not os.path.exists(OUTPUT_DIR):
         os.makedirs(OUTPUT_DIR)
         print(f"建立輸出目錄: {OUTPUT_DIR}")
 
     # 2. 初始化 Gradio Client
+    # 所有工作執行緒共用這一個 Client。gradio_client 上傳檔案與呼叫 API 時
+    # 每次都是獨立的 httpx 請求，沒有可以注入的連線池；API 預設架在本機，
+    # 建立連線的成本很低，所以直接沿用 handle_file，不另外改寫 HTTP 呼叫。
     try:
         client = Client(API_URL)
         print(f"成功連接 API: {API_URL}")
@@ -44,90 +186,46 @@ def main():
     # 3. 遍歷目錄
     print("開始掃描檔案...")
     
-    count_success = 0
-    count_fail = 0
-
-    for root, dirs, files in os.walk(SOURCE_DIR):
-        for file in files:
-            if file.lower().endswith(".wav"):
-                file_path = os.path.join(root, file)
-                
-                # === A. 解析 WAV 檔名獲取情緒與文本 ===
-                # 格式範例: 【开心】蕉蕉蕉.wav
-                match = re.match(r"^【(.*?)】(.*)\.wav$", file)
-                
-                if not match:
-                    print(f"[略過] 檔名格式不符: {file}")
+    # 同一個角色、同一種情緒只會輸出一個 .pt，照順序處理時後面成功的檔案會覆蓋前面的。
+    # 這裡依輸出檔名把 WAV 分組，每組只交給一個工作執行緒 (見 process_output)，
+    # 避免多個執行緒同時寫入同一個輸出檔。
+    jobs = {} # map[new_filename] = [(wav, full_name, emotion_zh, emotion_en, ref_text), ...]
+    with os.scandir(SOURCE_DIR) as entries:
+        for entry in entries:
+            # SOURCE_DIR 底下第一層就是角色資料夾
+            # 範例資料夾名: "星穹铁道-中文-「蕉授」"
+            # 直接放在 SOURCE_DIR 底下的檔案沒有角色資料夾，沿用檔名
+            if entry.is_dir(follow_symlinks=False):
+                if is_skipped_dir(entry.name):
                     continue
-                
-                emotion_zh = match.group(1) # 中文情緒
-                ref_text = match.group(2)   # REF文字
-
-                # 將中文情緒轉換為英文，如果找不到對應則預設為 'unknown'
-                emotion_en = EMOTION_MAP.get(emotion_zh, "unknown")
-
-                # === B. 解析資料夾名稱獲取角色資訊 ===
-                try:
-                    # 取得相對於 SOURCE_DIR 的第一層資料夾名
-                    # 範例資料夾名: "星穹铁道-中文-「蕉授」"
-                    rel_path = Path(file_path).relative_to(SOURCE_DIR)
-                    folder_name = rel_path.parts[0] 
-
-                    # 解析資料夾結構
-                    # 預期格式: 系列名-語言-角色名 (以 "-" 分隔)
-                    folder_parts = folder_name.split('-')
-                    
-                    if len(folder_parts) >= 3 and folder_parts[1] == '中文':
-                        series_name = folder_parts[0] # 星穹铁道
-                        role_name = folder_parts[2]   # 「蕉授」 (保留原括號，或可視需求移除)
-                        
-                        # 組合成 "名子" 部分 (用 _ 分隔)
-                        # 結果: 星穹铁道_「蕉授」
-                        full_name = f"{series_name}_{role_name}"
-                    else:
-                        # 格式不符時的備案
-                        full_name = folder_name.replace('-', '_')
-                        print(f"[警告] 資料夾格式特殊，將直接使用: {full_name}")
-
-                except Exception as e:
-                    print(f"[錯誤] 無法解析路徑: {file_path}, {e}")
+                wavs = walk_wavs(entry.path)
+            elif entry.name.endswith(WAV_SUFFIXES):
+                wavs = [entry]
+            else:
+                continue
+
+            for wav in wavs:
+                job = parse_wav(wav, entry.name)
+                if job is None:
                     continue
 
-                # === C. 呼叫 API ===
-                print(f"處理中: {full_name} | {emotion_zh} -> {emotion_en}")
-                
-                try:
-                    result = client.predict(
-                        ref_aud=handle_file(file_path),
-                        ref_txt=ref_text,
-                        use_xvec=False,
-                        api_name="/save_prompt"
-                    )
-                    
-                    generated_file_path = result[0]
-                    
-                    if generated_file_path and os.path.exists(generated_file_path):
-                        # === D. 重新命名並搬移 ===
-                        # 目標格式: zh-名子-emotion.pt
-                        # 範例: zh-星穹铁道_「蕉授」-happy.pt
-                        
-                        new_filename = f"zh-{full_name}-{emotion_en}.pt"
-                        destination = os.path.join(OUTPUT_DIR, new_filename)
-                        
-                        # 如果檔案已存在，先刪除舊的 (shutil.move 在某些系統覆蓋會有問題)
-                        if os.path.exists(destination):
-                            os.remove(destination)
-
-                        shutil.move(generated_file_path, destination)
-                        print(f"  -> 成功儲存: {new_filename}")
-                        count_success += 1
-                    else:
-                        print(f"  -> API 回傳成功但找不到檔案")
-                        count_fail += 1
-
-                except Exception as e:
-                    print(f"  -> API 呼叫失敗: {e}")
-                    count_fail += 1
+                full_name, _, emotion_en, _ = job
+                # 目標格式: zh-名子-emotion.pt
+                # 範例: zh-星穹铁道_「蕉授」-happy.pt
+                new_filename = f"zh-{full_name}-{emotion_en}.pt"
+                jobs.setdefault(new_filename, []).append((wav,) + job)
+
+    # 4. 並行呼叫 API (每個請求大部分時間都在等網路，多開幾個同時送)
+    # 成功與失敗以輸出檔為單位計算
+    count_success = 0
+    count_fail = 0
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for ok in executor.map(partial(process_output, client), jobs.keys(), jobs.values()):
+            if ok:
+                count_success += 1
+            else:
+                count_fail += 1
 
     print("------------------------------------------------")
     print(f"處理完成。成功: {count_success}, 失敗: {count_fail}")